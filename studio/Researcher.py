@@ -1,18 +1,31 @@
 import concurrent.futures
+import functools
 import json
 import os
+import threading
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 from utils.data_utils import execute_pandas_query_for_computation, sample_data
 from utils.file_operation import (
     clean_markdown_output,
+    dumps_json,
     load_cached_json,
     load_prompt_template,
-    save_json_data,
+    save_json_data_async,
 )
-from utils.llm_operations import extract_json_from_response, invoke_llm_with_prompt
+from utils.generate_dataset_profile import compact_profile_for_prompt
+from utils.llm_operations import (
+    SMALL_LLM_MODEL,
+    LLMStreamAborted,
+    extract_json_with_repair,
+    invoke_llm_with_prompt,
+)
+
+# Computed data is embedded in the visualization and narrative prompts; larger
+# payloads (in serialized characters) are skipped rather than sent
+_MAX_COMPUTED_DATA_CHARS = 50_000
 
 
 @dataclass
@@ -21,6 +34,9 @@ class ResearchConfig:
     breadth: int = 6
     max_workers: int = 8
     use_caching: bool = True
+    # Start the introduction and conclusion on the unfiltered sections while
+    # the filter runs; they are kept only if the filter drops nothing
+    speculative_report: bool = False
 
 
 @dataclass
@@ -47,6 +63,19 @@ class ResearchResult:
     category: str = ""
     source_columns: List[str] = field(default_factory=list)
 
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready form used for the state, cache files and final report"""
+        # Built by hand rather than with asdict(), which deep-copies computed_data
+        return {
+            "question": self.question,
+            "title": self.title,
+            "explanation": self.explanation,
+            "visualization_code": self.visualization_code,
+            "computed_data": self.computed_data,
+            "category": self.category,
+            "source_columns": self.source_columns,
+        }
+
 
 class Researcher:
     def __init__(self, config: ResearchConfig, dataset_profile: Dict):
@@ -54,6 +83,39 @@ class Researcher:
         self.dataset_profile = dataset_profile
         self.research_questions: List[ResearchQuestion] = []
         self.research_results: List[ResearchResult] = []
+        self._executors: Dict[str, concurrent.futures.ThreadPoolExecutor] = {}
+        # Research threads request the visualization pool concurrently
+        self._executors_lock = threading.Lock()
+
+    @functools.cached_property
+    def dataset_profile_json(self) -> str:
+        """Prompt-sized JSON of the dataset profile, serialized once per run"""
+        return dumps_json(
+            compact_profile_for_prompt(self.dataset_profile), compact=True
+        )
+
+    def _get_executor(
+        self, name: str, max_workers: int
+    ) -> concurrent.futures.ThreadPoolExecutor:
+        """Return a thread pool that is reused by every step of the run"""
+        with self._executors_lock:
+            executor = self._executors.get(name)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix=f"researcher-{name}"
+                )
+                self._executors[name] = executor
+            return executor
+
+    def close(self):
+        """Shut down the thread pools shared across research steps"""
+        # Detach the pools under the lock, but wait outside it: running tasks
+        # may still ask for an executor
+        with self._executors_lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=True)
 
     # Step 1: Generate research questions
     def generate_research_questions(self):
@@ -93,7 +155,9 @@ class Researcher:
                     for q in self.research_questions
                 ]
             }
-            save_json_data(questions_dict, "research_questions.json", "./datasets")
+            save_json_data_async(
+                questions_dict, "research_questions.json", "./datasets"
+            )
 
         return self.research_questions
 
@@ -112,49 +176,34 @@ class Researcher:
                 return self.research_results
 
         # Conduct research in parallel
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.config.max_workers
-        ) as executor:
-            # Submit all research tasks
-            research_results_to_question = {
-                executor.submit(self._conduct_research_for_question, question): question
-                for question in self.research_questions
-            }
+        executor = self._get_executor("research", self.config.max_workers)
+        # Submit all research tasks
+        research_results_to_question = {
+            executor.submit(self._conduct_research_for_question, question): question
+            for question in self.research_questions
+        }
 
-            # Collect results
-            results = []
-            for research_result in concurrent.futures.as_completed(
-                research_results_to_question
-            ):
-                question = research_results_to_question[research_result]
-                try:
-                    result = research_result.result()
-                    if result:
-                        results.append(result)
-                except Exception as exc:
-                    print(
-                        f'Research for "{question.question}" generated an exception: {exc}'
-                    )
+        # Collect results
+        results = []
+        for research_result in concurrent.futures.as_completed(
+            research_results_to_question
+        ):
+            question = research_results_to_question[research_result]
+            try:
+                result = research_result.result()
+                if result:
+                    results.append(result)
+            except Exception as exc:
+                print(
+                    f'Research for "{question.question}" generated an exception: {exc}'
+                )
 
         self.research_results = results
 
         # Save research results to JSON
         if self.config.use_caching:
-            results_dict = {
-                "results": [
-                    {
-                        "question": r.question,
-                        "title": r.title,
-                        "explanation": r.explanation,
-                        "visualization_code": r.visualization_code,
-                        "computed_data": r.computed_data,
-                        "category": r.category,
-                        "source_columns": r.source_columns,
-                    }
-                    for r in self.research_results
-                ]
-            }
-            save_json_data(results_dict, "research_results.json", "./datasets")
+            results_dict = {"results": [r.to_dict() for r in self.research_results]}
+            save_json_data_async(results_dict, "research_results.json", "./datasets")
 
         return results
 
@@ -171,19 +220,56 @@ class Researcher:
                 print("Using cached final arrangement")
                 return cached_arrangement
 
+        executor = self._get_executor("research", self.config.max_workers)
+
+        # The introduction and conclusion only depend on the sections that
+        # survive filtering; speculatively assume all of them do
+        speculation = None
+        if self.config.speculative_report and self.research_results:
+            speculative_json = self._lightweight_results_json(self.research_results)
+            speculation = (
+                speculative_json,
+                executor.submit(
+                    self._generate_research_paper_introduction, speculative_json
+                ),
+                executor.submit(
+                    self._generate_research_paper_conclusion, speculative_json
+                ),
+            )
+
         filtered_research_sections = self._filter_research_sections(
             self.research_results
         )
 
-        # Generate Research Paper Title, Introduction, and Conclusion
-        introduction = self._generate_research_paper_introduction(
-            filtered_research_sections
-        )
-        conclusion = self._generate_research_paper_conclusion(
+        # Title, introduction and conclusion all see the same lightweight view
+        # of the sections, so build and serialize it once
+        lightweight_research_results_json = self._lightweight_results_json(
             filtered_research_sections
         )
+
+        # Generate Research Paper Title, Introduction, and Conclusion; the
+        # introduction and conclusion don't depend on each other, so they are
+        # requested concurrently and only the title waits for both
+        if speculation and speculation[0] == lightweight_research_results_json:
+            print("Using speculative introduction and conclusion")
+            introduction_future, conclusion_future = speculation[1:]
+        else:
+            if speculation:
+                print("Filter changed the sections; discarding speculative drafts")
+                for future in speculation[1:]:
+                    future.cancel()
+            introduction_future = executor.submit(
+                self._generate_research_paper_introduction,
+                lightweight_research_results_json,
+            )
+            conclusion_future = executor.submit(
+                self._generate_research_paper_conclusion,
+                lightweight_research_results_json,
+            )
+        introduction = introduction_future.result()
+        conclusion = conclusion_future.result()
         title = self._generate_research_paper_title(
-            filtered_research_sections, introduction, conclusion
+            lightweight_research_results_json, introduction, conclusion
         )
 
         # Arrange the research sections
@@ -192,19 +278,9 @@ class Researcher:
         )
 
         # Convert ResearchResult objects to dictionaries for JSON serialization
-        arranged_sections_dicts = []
-        for result in arranged_research_sections:
-            arranged_sections_dicts.append(
-                {
-                    "question": result.question,
-                    "title": result.title,
-                    "explanation": result.explanation,
-                    "visualization_code": result.visualization_code,
-                    "computed_data": result.computed_data,
-                    "category": result.category,
-                    "source_columns": result.source_columns,
-                }
-            )
+        arranged_sections_dicts = [
+            result.to_dict() for result in arranged_research_sections
+        ]
 
         final_arrangement = {
             "title": title,
@@ -216,7 +292,9 @@ class Researcher:
 
         # Save final arrangement to JSON
         if self.config.use_caching:
-            save_json_data(final_arrangement, "final_arrangement.json", "./datasets")
+            save_json_data_async(
+                final_arrangement, "final_arrangement.json", "./datasets"
+            )
 
         return final_arrangement
 
@@ -230,7 +308,7 @@ class Researcher:
             "user_prompts", "generate_breadth_questions.md"
         )
 
-        dataset_profile_json = json.dumps(self.dataset_profile, indent=2)
+        dataset_profile_json = self.dataset_profile_json
         breadth_questions_data = invoke_llm_with_prompt(
             system_prompt,
             user_prompt,
@@ -239,7 +317,7 @@ class Researcher:
                 "dataset_profile_json": dataset_profile_json,
             },
         )
-        breadth_questions_data_json = extract_json_from_response(breadth_questions_data)
+        breadth_questions_data_json = extract_json_with_repair(breadth_questions_data)
 
         breadth_questions = []
 
@@ -267,26 +345,22 @@ class Researcher:
         depth_questions = []
 
         # Use ThreadPoolExecutor for parallel processing
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.config.max_workers
-        ) as executor:
-            follow_up_to_parent_question = {
-                executor.submit(
-                    self._generate_depth_questions_for_parent, parent
-                ): parent
-                for parent in breadth_questions
-            }
+        executor = self._get_executor("research", self.config.max_workers)
+        follow_up_to_parent_question = {
+            executor.submit(self._generate_depth_questions_for_parent, parent): parent
+            for parent in breadth_questions
+        }
 
-            # Collect results as they complete
-            for future in concurrent.futures.as_completed(follow_up_to_parent_question):
-                parent = follow_up_to_parent_question[future]
-                try:
-                    questions = future.result()
-                    depth_questions.extend(questions)
-                except Exception as exc:
-                    print(
-                        f'Question generation for "{parent.question}" generated an exception: {exc}'
-                    )
+        # Collect results as they complete
+        for future in concurrent.futures.as_completed(follow_up_to_parent_question):
+            parent = follow_up_to_parent_question[future]
+            try:
+                questions = future.result()
+                depth_questions.extend(questions)
+            except Exception as exc:
+                print(
+                    f'Question generation for "{parent.question}" generated an exception: {exc}'
+                )
 
         return depth_questions
 
@@ -301,7 +375,7 @@ class Researcher:
             "user_prompts", "generate_depth_questions.md"
         )
 
-        dataset_profile_json = json.dumps(self.dataset_profile, indent=2)
+        dataset_profile_json = self.dataset_profile_json
         response = invoke_llm_with_prompt(
             system_prompt,
             user_prompt,
@@ -314,7 +388,7 @@ class Researcher:
             },
         )
 
-        questions_data = extract_json_from_response(response)
+        questions_data = extract_json_with_repair(response)
 
         depth_questions = []
         # Check if it's an error response
@@ -349,28 +423,40 @@ class Researcher:
         # Step 2.2: Execute Pandas Code
         computed_data = execute_pandas_query_for_computation(pandas_code)
 
-        if not computed_data or len(computed_data) > 10000:
+        # Failed queries and empty results have nothing to visualize
+        data = computed_data.get("data") if computed_data else None
+        if (
+            not computed_data
+            or "error" in computed_data
+            or data is None
+            or (isinstance(data, dict) and "error" in data)
+        ):
+            print(f"Skipping question - no computed data: {question.question}")
+            return None  # type: ignore
+
+        # Both prompts embed the full computed data; serialize it once, compactly,
+        # and bound what is sent by its serialized size rather than its item count
+        computed_data_json = dumps_json(computed_data, compact=True)
+        if len(computed_data_json) > _MAX_COMPUTED_DATA_CHARS:
             print(
-                f"Skipping question - inapplicable data: {question.question} : {len(computed_data)}"
+                f"Skipping question - computed data too large: {question.question} : "
+                f"{len(computed_data_json)} chars"
             )
             return None  # type: ignore
 
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=min(2, self.config.max_workers)
-        ) as executor:
-            viz_for_question = executor.submit(
-                self._generate_visualization_code, question, computed_data
-            )
-            title_for_viz = executor.submit(
-                self._generate_title_for_visualization, question, computed_data
-            )
-            narrative_for_viz = executor.submit(
-                self._generate_narrative_for_visualization, question, computed_data
-            )
+        executor = self._get_executor("visualization", 2 * self.config.max_workers)
+        viz_for_question = executor.submit(
+            self._generate_visualization_code, question, computed_data_json
+        )
+        # Title and narrative share every input, so one call produces both
+        title_and_narrative = executor.submit(
+            self._generate_title_and_narrative_for_visualization,
+            question,
+            computed_data_json,
+        )
 
-            viz_code = viz_for_question.result()
-            title = title_for_viz.result()
-            narrative = narrative_for_viz.result()
+        viz_code = viz_for_question.result()
+        title, narrative = title_and_narrative.result()
 
         return ResearchResult(
             question=question.question,
@@ -403,6 +489,7 @@ class Researcher:
                 "source_columns": question.source_columns,
                 "sampled_data": sample_data_stringified,
             },
+            max_tokens=1200,
         )
 
         pandas_code = clean_markdown_output(pandas_code)
@@ -410,11 +497,9 @@ class Researcher:
         return pandas_code
 
     def _generate_visualization_code(
-        self, question: ResearchQuestion, computed_data: Any
+        self, question: ResearchQuestion, computed_data: str
     ) -> str:
-        """Generate Python matplotlib/seaborn code for the computed data"""
-        # Use entire computed data, not just a sample
-        computed_data = json.dumps(computed_data, indent=2)
+        """Generate Python matplotlib/seaborn code for the computed data JSON"""
 
         system_prompt = load_prompt_template(
             "sys_prompts", "generate_visualization_code.md"
@@ -432,11 +517,49 @@ class Researcher:
                 "category": question.category,
                 "computed_data": computed_data,
             },
+            max_tokens=2048,
         )
         viz_code = clean_markdown_output(viz_code)
 
         return viz_code
 
+    def _generate_title_and_narrative_for_visualization(
+        self, question: ResearchQuestion, computed_data: Any
+    ) -> Tuple[str, str]:
+        system_prompt = load_prompt_template(
+            "sys_prompts", "generate_visualization_title_and_narrative.md"
+        )
+        user_prompt = load_prompt_template(
+            "user_prompts", "generate_visualization_title_and_narrative.md"
+        )
+
+        response = invoke_llm_with_prompt(
+            system_prompt,
+            user_prompt,
+            {
+                "question": question.question,
+                "category": question.category,
+                "computed_data": computed_data,
+            },
+            json_mode=True,
+            max_tokens=1200,
+        )
+        sections = extract_json_with_repair(response)
+
+        title = sections.get("title") if isinstance(sections, dict) else None
+        narrative = sections.get("narrative") if isinstance(sections, dict) else None
+        if not isinstance(title, str) or not isinstance(narrative, str):
+            # Fall back to the dedicated prompts when the combined reply is unusable
+            print(
+                f"Falling back to separate title/narrative calls: {question.question}"
+            )
+            return (
+                self._generate_title_for_visualization(question, computed_data),
+                self._generate_narrative_for_visualization(question, computed_data),
+            )
+
+        return title.strip(), narrative.strip()
+
     def _generate_title_for_visualization(
         self, question: ResearchQuestion, computed_data: Any
     ) -> str:
@@ -455,6 +578,8 @@ class Researcher:
                 "category": question.category,
                 "computed_data": computed_data,
             },
+            model=SMALL_LLM_MODEL,
+            max_tokens=128,
         )
 
         return title
@@ -477,6 +602,7 @@ class Researcher:
                 "category": question.category,
                 "computed_data": computed_data,
             },
+            max_tokens=1024,
         )
 
         return narrative
@@ -488,6 +614,15 @@ class Researcher:
             print("Research results are empty")
             return []
 
+        # Nothing to deduplicate or balance in a single usable result
+        if (
+            len(research_results) == 1
+            and research_results[0].computed_data
+            and research_results[0].visualization_code
+        ):
+            print("LLM quality filtering: single result kept without filtering")
+            return list(research_results)
+
         unfiltered_research_results = []
         for idx, result in enumerate(research_results):
             result_summary = {
@@ -513,11 +648,14 @@ class Researcher:
             user_prompt,
             {
                 "research_results_size": len(unfiltered_research_results),
-                "research_results": json.dumps(unfiltered_research_results, indent=2),
+                "research_results": dumps_json(
+                    unfiltered_research_results, compact=True
+                ),
             },
+            max_tokens=512,
         )
 
-        selected_indices = extract_json_from_response(selected_indices)
+        selected_indices = extract_json_with_repair(selected_indices)
         if isinstance(selected_indices, list):
             filtered_research_results = [
                 self.research_results[i] for i in selected_indices
@@ -531,7 +669,7 @@ class Researcher:
             return []
 
     def _generate_research_paper_introduction(
-        self, research_results: List[ResearchResult]
+        self, lightweight_research_results_json: str
     ) -> str:
         system_prompt = load_prompt_template(
             "sys_prompts", "generate_research_paper_introduction.md"
@@ -540,29 +678,17 @@ class Researcher:
             "user_prompts", "generate_research_paper_introduction.md"
         )
 
-        lightweighted_research_results = []
-        for result in research_results:
-            lightweighted_research_results.append(
-                {
-                    "question": result.question,
-                    "title": result.title,
-                    "explanation": result.explanation,
-                }
-            )
-
         introduction = invoke_llm_with_prompt(
             system_prompt,
             user_prompt,
             {
-                "research_results": json.dumps(
-                    lightweighted_research_results, indent=2
-                ),
+                "research_results": lightweight_research_results_json,
             },
         )
         return introduction
 
     def _generate_research_paper_conclusion(
-        self, research_results: List[ResearchResult]
+        self, lightweight_research_results_json: str
     ) -> str:
         system_prompt = load_prompt_template(
             "sys_prompts", "generate_research_paper_conclusion.md"
@@ -571,29 +697,31 @@ class Researcher:
             "user_prompts", "generate_research_paper_conclusion.md"
         )
 
-        lightweighted_research_results = []
-        for result in research_results:
-            lightweighted_research_results.append(
-                {
-                    "question": result.question,
-                    "title": result.title,
-                    "explanation": result.explanation,
-                }
-            )
-
         conclusion = invoke_llm_with_prompt(
             system_prompt,
             user_prompt,
             {
-                "research_results": json.dumps(
-                    lightweighted_research_results, indent=2
-                ),
+                "research_results": lightweight_research_results_json,
             },
         )
         return conclusion
 
+    def _lightweight_results_json(self, research_results: List[ResearchResult]) -> str:
+        """The question/title/explanation view of sections used by report prompts"""
+        return dumps_json(
+            [
+                {
+                    "question": result.question,
+                    "title": result.title,
+                    "explanation": result.explanation,
+                }
+                for result in research_results
+            ],
+            compact=True,
+        )
+
     def _generate_research_paper_title(
-        self, research_results: List[ResearchResult], introduction: str, conclusion: str
+        self, lightweight_research_results_json: str, introduction: str, conclusion: str
     ) -> str:
         system_prompt = load_prompt_template(
             "sys_prompts", "generate_research_paper_title.md"
@@ -602,27 +730,16 @@ class Researcher:
             "user_prompts", "generate_research_paper_title.md"
         )
 
-        # Convert ResearchResult objects to dictionaries for JSON serialization
-        lightweighted_research_results = []
-        for result in research_results:
-            lightweighted_research_results.append(
-                {
-                    "question": result.question,
-                    "title": result.title,
-                    "explanation": result.explanation,
-                }
-            )
-
         title = invoke_llm_with_prompt(
             system_prompt,
             user_prompt,
             {
-                "research_results": json.dumps(
-                    lightweighted_research_results, indent=2
-                ),
+                "research_results": lightweight_research_results_json,
                 "introduction": introduction,
                 "conclusion": conclusion,
             },
+            model=SMALL_LLM_MODEL,
+            max_tokens=128,
         )
         return title
 
@@ -640,6 +757,13 @@ class Researcher:
             "user_prompts", "arrange_research_sections.md"
         )
 
+        # Zero or one section has only one possible order
+        if len(research_results) <= 1:
+            print(
+                f"Research sections arrangement for {len(research_results)} completed"
+            )
+            return list(research_results)
+
         research_results_with_indices = []
         for idx, result in enumerate(research_results):
             research_results_with_indices.append(
@@ -653,18 +777,39 @@ class Researcher:
                 }
             )
 
-        arranged_indices = invoke_llm_with_prompt(
-            system_prompt,
-            user_prompt,
-            replacements={
-                "title": title,
-                "introduction": introduction,
-                "conclusion": conclusion,
-                "research_results": json.dumps(research_results_with_indices, indent=2),
-            },
-        )
+        # Stream the arrangement so progress shows while the model works, and
+        # stop early if it writes a paragraph of prose with no JSON array in it
+        received = []
+
+        def on_chunk(text: str) -> None:
+            if not received:
+                print("Arranging research sections: receiving response")
+            received.append(text)
+            head = "".join(received)
+            if len(head) > 200 and "[" not in head:
+                raise LLMStreamAborted(f"Expected a JSON array, got: {head[:80]!r}")
+
+        try:
+            arranged_indices = invoke_llm_with_prompt(
+                system_prompt,
+                user_prompt,
+                replacements={
+                    "title": title,
+                    "introduction": introduction,
+                    "conclusion": conclusion,
+                    "research_results": dumps_json(
+                        research_results_with_indices, compact=True
+                    ),
+                },
+                on_chunk=on_chunk,
+                max_tokens=512,
+            )
+        except LLMStreamAborted as e:
+            # Keep every section in its original order rather than losing them
+            print(f"Research sections arrangement aborted, keeping order: {e}")
+            return list(research_results)
 
-        arranged_indices = extract_json_from_response(arranged_indices)
+        arranged_indices = extract_json_with_repair(arranged_indices)
         if isinstance(arranged_indices, list):
             arranged_research_results = [research_results[i] for i in arranged_indices]
             print(
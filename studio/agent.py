@@ -1,22 +1,32 @@
 import base64
+import concurrent.futures
 import io
-from typing import Any, Dict, List, Union
+import os
+import re
+from typing import Any, Dict, List, Optional, TextIO, Tuple, Union
 
 import matplotlib
-
-matplotlib.use("Agg")  # Use non-interactive backend
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import seaborn as sns
 from helpers import get_llm
 from langgraph.graph import END, START, StateGraph
-from Researcher import ResearchConfig, Researcher
+from Researcher import ResearchConfig, Researcher, ResearchQuestion, ResearchResult
 from typing_extensions import TypedDict
-from utils.file_operation import load_cached_json, read_csv_data, save_json_data
+from utils.file_operation import load_cached_json, save_json_data_async
 from utils.generate_dataset_profile import generate_dataset_profile
 
+matplotlib.use("Agg")  # Use non-interactive backend
+
 # Type alias for JSON-compatible types
 JSONType = Union[str, int, float, bool, None, Dict[str, "JSONType"], List["JSONType"]]
 
+# Block-level tags that must not be wrapped in <p> by markdown_to_html_enhanced
+_BLOCK_TAG_RE = re.compile(r"<(?:h[1-3]|ul|li)>")
+# Characters any of the markdown conversions need to find before they apply
+_MARKDOWN_CHARS = frozenset("#*`-")
+
 
 class State(TypedDict):
     dataset_info: JSONType
@@ -27,6 +37,15 @@ class State(TypedDict):
     _agent: Any  # Agent instance for accessing researcher
 
 
+def _matches_state(items: List[Any], items_data: Any) -> bool:
+    """Check whether in-memory research objects match their serialized state"""
+    if not isinstance(items_data, list) or len(items) != len(items_data):
+        return False
+    return all(
+        item.question == data["question"] for item, data in zip(items, items_data)
+    )
+
+
 # Step 1: Generate Research Questions using Researcher class
 def generate_research_questions(state: State):
     agent = state.get("_agent")
@@ -58,29 +77,19 @@ def conduct_research(state: State):
     if not agent or not agent.researcher:
         raise RuntimeError("Researcher not initialized. Call agent.initialize() first.")
 
-    # Restore research questions from state
-    from Researcher import ResearchQuestion
-
-    agent.researcher.research_questions = [
-        ResearchQuestion(**q) for q in state["research_questions"]  # type: ignore
-    ]
+    # Restore research questions from state, unless the researcher still holds
+    # the objects it produced in step 1
+    questions_data = state["research_questions"]
+    if not _matches_state(agent.researcher.research_questions, questions_data):
+        agent.researcher.research_questions = [
+            ResearchQuestion(**q) for q in questions_data  # type: ignore
+        ]
 
     # Conduct research
     research_results = agent.researcher.conduct_research()
 
     # Convert to serializable format
-    results_data = [
-        {
-            "question": r.question,
-            "computed_data": r.computed_data,
-            "explanation": r.explanation,
-            "visualization_code": r.visualization_code,
-            "title": r.title,
-            "category": r.category,
-            "source_columns": r.source_columns,
-        }
-        for r in research_results
-    ]
+    results_data = [r.to_dict() for r in research_results]
 
     return {"research_results": results_data}
 
@@ -91,12 +100,13 @@ def generate_final_report(state: State):
     if not agent or not agent.researcher:
         raise RuntimeError("Researcher not initialized. Call agent.initialize() first.")
 
-    # Restore research results from state
-    from Researcher import ResearchResult
-
-    agent.researcher.research_results = [
-        ResearchResult(**r) for r in state["research_results"]  # type: ignore
-    ]
+    # Restore research results from state, unless the researcher still holds
+    # the objects it produced in step 2
+    results_data = state["research_results"]
+    if not _matches_state(agent.researcher.research_results, results_data):
+        agent.researcher.research_results = [
+            ResearchResult(**r) for r in results_data  # type: ignore
+        ]
 
     # Generate final arrangement
     final_arrangement = agent.researcher.generate_final_report()
@@ -141,6 +151,13 @@ class Agent:
         self.workflow = None
         self.researcher = None
         self.config = None
+        self.output_path = "output.html"
+        # Inline charts as base64 data URIs, so output.html is a single
+        # self-contained report; False writes them to a charts/ directory next
+        # to the HTML output and links them, skipping the base64 encoding
+        self.embed_charts = True
+        self._chart_dirs: Optional[Tuple[str, str]] = None
+        self._chart_figure: Optional[matplotlib.figure.Figure] = None
 
     def initialize(self):
         """Initialize the workflow and researcher instance"""
@@ -153,6 +170,18 @@ class Agent:
 
         # Note: researcher will be initialized with dataset_profile in initialize_state_from_csv
 
+    def _init_researcher(self, dataset_profile: Dict[str, Any]) -> None:
+        """Create the researcher for a dataset profile, reusing an existing one"""
+        if self.config is None:
+            self.config = ResearchConfig(
+                depth=3, breadth=4, max_workers=8, use_caching=True
+            )
+        if (
+            self.researcher is None
+            or self.researcher.dataset_profile is not dataset_profile
+        ):
+            self.researcher = Researcher(self.config, dataset_profile)
+
     def initialize_state_from_csv(self) -> dict:
         """Initialize state with dataset profile and info"""
         path = "./dataset.csv"
@@ -164,36 +193,28 @@ class Agent:
         if cached_info and cached_profile:
             print("Using cached dataset info and profile")
             # Initialize researcher with cached profile
-            if self.config is None:
-                self.config = ResearchConfig(
-                    depth=3, breadth=4, max_workers=8, use_caching=True
-                )
-            self.researcher = Researcher(self.config, cached_profile)
+            self._init_researcher(cached_profile)
             return {"dataset_info": cached_info, "dataset_profile": cached_profile}
 
+        # Read the dataset once; both the info and the profile come from it
+        df = pd.read_csv(path)
+
         # Generate dataset info
-        csv_data = read_csv_data(path)
         dataset_info = {
             "file_name": path,
-            "num_rows": csv_data["num_rows"],
-            "attributes": csv_data["headers"],
-            "rows": csv_data["data"],
+            "num_rows": len(df),
+            "attributes": df.columns.tolist(),
+            # Missing cells become None, as they read back from the JSON cache
+            "rows": df.astype(object).where(df.notna(), None).to_dict(orient="records"),
         }
-        save_json_data(dataset_info, "dataset_info.json", "./datasets")
+        save_json_data_async(dataset_info, "dataset_info.json", "./datasets")
 
         # Generate dataset profile
-        import pandas as pd
-
-        df = pd.read_csv(path)
         dataset_profile = generate_dataset_profile(df)
-        save_json_data(dataset_profile, "dataset_profile.json", "./datasets")
+        save_json_data_async(dataset_profile, "dataset_profile.json", "./datasets")
 
         # Initialize researcher with generated profile
-        if self.config is None:
-            self.config = ResearchConfig(
-                depth=3, breadth=4, max_workers=8, use_caching=True
-            )
-        self.researcher = Researcher(self.config, dataset_profile)
+        self._init_researcher(dataset_profile)
 
         print(
             f"Dataset initialized: {dataset_info['num_rows']} rows, {len(dataset_info['attributes'])} columns"
@@ -209,22 +230,35 @@ class Agent:
 
         final_arrangement = output_state.get("final_arrangement", {})
 
-        # Generate HTML content
-        html_content = self.generate_html_report_with_python_charts(final_arrangement)
-
-        # Save HTML file
-        output_path = "output.html"
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        # Stream the HTML straight into the output file
+        output_path = self.output_path
+        with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            self.write_html_report(final_arrangement, f)
 
         print(f"HTML report generated: {output_path}")
-        return html_content
+        return output_path
 
     def generate_html_report_with_python_charts(
         self, final_arrangement: Dict[str, Any]
     ) -> str:
         """Generate HTML report with Python visualizations rendered as images"""
-        html_lines = [
+        html = io.StringIO()
+        self.write_html_report(final_arrangement, html)
+        return html.getvalue()
+
+    def write_html_report(
+        self, final_arrangement: Dict[str, Any], html: TextIO
+    ) -> None:
+        """Write the HTML report line by line into a text stream"""
+        # Chart locations are resolved on first use against the current output_path
+        self._chart_dirs = None
+
+        def write_lines(*lines: str) -> None:
+            for line in lines:
+                html.write(line)
+                html.write("\n")
+
+        write_lines(
             "<!DOCTYPE html>",
             "<html lang='en'>",
             "<head>",
@@ -250,112 +284,132 @@ class Agent:
             "</head>",
             "<body>",
             "  <div class='container'>",
-        ]
+        )
 
         # Title
         title = final_arrangement.get("title", "Data Analysis Report")
-        html_lines.append(f"    <h1>{title}</h1>")
+        write_lines(f"    <h1>{title}</h1>")
 
         # Introduction
         introduction = final_arrangement.get("introduction", "")
         if introduction:
-            html_lines.extend(
-                [
-                    "    <div class='section'>",
-                    "      <h2>Introduction</h2>",
-                    f"      {self.markdown_to_html_enhanced(introduction)}",
-                    "    </div>",
-                ]
+            write_lines(
+                "    <div class='section'>",
+                "      <h2>Introduction</h2>",
+                f"      {self.markdown_to_html_enhanced(introduction)}",
+                "    </div>",
             )
 
         # Results
         results = final_arrangement.get("results", [])
         if results:
-            html_lines.extend(
-                [
-                    "    <div class='section'>",
-                    "      <h2>Research Findings</h2>",
-                ]
+            write_lines(
+                "    <div class='section'>",
+                "      <h2>Research Findings</h2>",
             )
 
-            for i, result in enumerate(results):
-                # Generate chart image if visualization code exists
-                chart_html = self.generate_chart_html(
-                    result.get("visualization_code", ""),
-                    result.get("computed_data"),
-                    f"chart_{i}",
-                )
+            # Render every chart up front; encoding/writing the PNGs overlaps
+            # with rendering the next chart
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(8, len(results))
+            ) as executor:
+                chart_futures = [
+                    # Generate chart image if visualization code exists
+                    self.submit_chart_html(
+                        executor,
+                        result.get("visualization_code", ""),
+                        result.get("computed_data"),
+                        f"chart_{i}",
+                    )
+                    for i, result in enumerate(results)
+                ]
 
-                html_lines.extend(
-                    [
-                        "      <div class='result-item'>",
-                        f"        <div class='category-badge'>{result.get('category', 'Analysis')}</div>",
-                        f"        <h3>{result.get('title', 'Research Finding')}</h3>",
-                    ]
+            for result, chart_future in zip(results, chart_futures):
+                chart_html = chart_future.result()
+
+                write_lines(
+                    "      <div class='result-item'>",
+                    f"        <div class='category-badge'>{result.get('category', 'Analysis')}</div>",
+                    f"        <h3>{result.get('title', 'Research Finding')}</h3>",
                 )
 
                 # Add chart
-                html_lines.extend(
-                    [
-                        "        <div class='chart-container'>",
-                        f"          {chart_html}",
-                        "        </div>",
-                    ]
+                write_lines(
+                    "        <div class='chart-container'>",
+                    f"          {chart_html}",
+                    "        </div>",
                 )
 
                 # Add explanation
                 explanation = result.get("explanation", "")
                 if explanation:
-                    html_lines.extend(
-                        [
-                            "        <div class='explanation'>",
-                            f"          {self.markdown_to_html_enhanced(explanation)}",
-                            "        </div>",
-                        ]
+                    write_lines(
+                        "        <div class='explanation'>",
+                        f"          {self.markdown_to_html_enhanced(explanation)}",
+                        "        </div>",
                     )
 
-                html_lines.append("      </div>")
+                write_lines("      </div>")
 
-            html_lines.append("    </div>")
+            write_lines("    </div>")
 
         # Conclusion
         conclusion = final_arrangement.get("conclusion", "")
         if conclusion:
-            html_lines.extend(
-                [
-                    "    <div class='section'>",
-                    "      <h2>Conclusion</h2>",
-                    f"      {self.markdown_to_html_enhanced(conclusion)}",
-                    "    </div>",
-                ]
+            write_lines(
+                "    <div class='section'>",
+                "      <h2>Conclusion</h2>",
+                f"      {self.markdown_to_html_enhanced(conclusion)}",
+                "    </div>",
             )
 
-        html_lines.extend(
-            [
-                "  </div>",
-                "</body>",
-                "</html>",
-            ]
+        write_lines(
+            "  </div>",
+            "</body>",
+            "</html>",
         )
 
-        return "\n".join(html_lines)
-
     def generate_chart_html(
         self, viz_code: str, computed_data: Any, chart_id: str
     ) -> str:
         """Generate HTML for visualization - handles Python matplotlib/seaborn code"""
+        return self.submit_chart_html(None, viz_code, computed_data, chart_id).result()
+
+    def submit_chart_html(
+        self,
+        executor: Optional[concurrent.futures.Executor],
+        viz_code: str,
+        computed_data: Any,
+        chart_id: str,
+    ) -> "concurrent.futures.Future[str]":
+        """
+        Render a chart on the calling thread and encode/write its PNG on the
+        executor (inline when executor is None). pyplot keeps global state, so
+        only the rendering has to stay serialized.
+        """
         if not viz_code:
-            return '<div class="error-chart">No visualization code available</div>'
+            return self._completed_chart_html(
+                '<div class="error-chart">No visualization code available</div>'
+            )
 
         try:
-            # Handle as Python matplotlib/seaborn code
-            import numpy as np
-            import pandas as pd
+            png_buffer = self._render_chart_png(viz_code, computed_data)
+        except Exception as e:
+            return self._completed_chart_html(self._chart_error_html(chart_id, e))
+
+        if executor is None:
+            return self._completed_chart_html(
+                self._encode_chart_html(png_buffer, chart_id)
+            )
+        return executor.submit(self._encode_chart_html, png_buffer, chart_id)
 
-            # Clear any existing plots
-            plt.clf()
-            plt.figure(figsize=(10, 6))
+    def _render_chart_png(self, viz_code: str, computed_data: Any) -> io.BytesIO:
+        """Execute matplotlib/seaborn code and return the rendered PNG buffer"""
+        # Handle as Python matplotlib/seaborn code
+        # Draw into a fresh state of the shared figure
+        fig = self._acquire_chart_figure()
 
+        try:
             # Prepare the data
             if isinstance(computed_data, list) and computed_data:
                 df = pd.DataFrame(computed_data)
@@ -379,30 +433,90 @@ class Agent:
             # Execute the visualization code
             exec(viz_code, exec_env)
 
-            # Save plot to base64 string
+            # One layout pass instead of bbox_inches="tight"'s re-render, and a
+            # fast zlib level; 96 dpi keeps embedded reports small
+            plt.gcf().tight_layout()
             buffer = io.BytesIO()
             plt.savefig(
-                buffer, format="png", dpi=150, bbox_inches="tight", facecolor="white"
+                buffer,
+                format="png",
+                dpi=96,
+                facecolor="white",
+                pil_kwargs={"compress_level": 1},
             )
-            buffer.seek(0)
-
-            # Convert to base64
-            image_data = base64.b64encode(buffer.getvalue()).decode()
-            buffer.close()
-
-            # Clear the plot
-            plt.clf()
-            plt.close()
-
-            return f'<img src="data:image/png;base64,{image_data}" alt="Chart {chart_id}" style="max-width: 100%; height: auto;">'
-
+            return buffer
+        finally:
+            # Keep the shared figure for the next chart; drop any the code opened
+            for fig_num in plt.get_fignums():
+                if plt.figure(fig_num) is not fig:
+                    plt.close(fig_num)
+            fig.clear()
+
+    def _acquire_chart_figure(self) -> matplotlib.figure.Figure:
+        """Return the reusable chart figure, cleared and made current"""
+        fig = self._chart_figure
+        if (
+            fig is not None
+            and plt.fignum_exists(fig.number)
+            and plt.figure(fig.number) is fig
+        ):
+            fig.clear()
+            fig.set_size_inches(10, 6)
+        else:
+            # First chart, or the visualization code closed the figure itself
+            fig = self._chart_figure = plt.figure(figsize=(10, 6))
+        return fig
+
+    def _encode_chart_html(self, png_buffer: io.BytesIO, chart_id: str) -> str:
+        """Embed or write out a rendered PNG and return its <img> tag"""
+        try:
+            with png_buffer.getbuffer() as png_view:
+                if self.embed_charts:
+                    # Convert to base64 straight from the buffer's memory (no
+                    # bytes copy); the base64 alphabet is pure ASCII
+                    image_data = base64.b64encode(png_view).decode("ascii")
+                    image_src = f"data:image/png;base64,{image_data}"
+                else:
+                    # Save plot next to the report and link it by relative path
+                    output_dir, chart_dir = self._resolve_chart_dirs()
+                    chart_file = os.path.join(chart_dir, f"{chart_id}.png")
+                    with open(chart_file, "wb") as f:
+                        f.write(png_view)
+                    image_src = os.path.relpath(chart_file, output_dir).replace(
+                        os.sep, "/"
+                    )
         except Exception as e:
-            print(f"Error generating chart {chart_id}: {e}")
-            return f'<div class="error-chart">Error generating visualization: {str(e)}</div>'
+            return self._chart_error_html(chart_id, e)
+        finally:
+            png_buffer.close()
+
+        return f'<img src="{image_src}" alt="Chart {chart_id}" style="max-width: 100%; height: auto;">'
+
+    def _resolve_chart_dirs(self) -> Tuple[str, str]:
+        """Resolve (and create) the report and chart directories once per report"""
+        if self._chart_dirs is None:
+            output_dir = os.path.dirname(os.path.abspath(self.output_path))
+            chart_dir = os.path.join(output_dir, "charts")
+            os.makedirs(chart_dir, exist_ok=True)
+            self._chart_dirs = (output_dir, chart_dir)
+        return self._chart_dirs
+
+    @staticmethod
+    def _chart_error_html(chart_id: str, error: Exception) -> str:
+        print(f"Error generating chart {chart_id}: {error}")
+        return f'<div class="error-chart">Error generating visualization: {str(error)}</div>'
+
+    @staticmethod
+    def _completed_chart_html(html: str) -> "concurrent.futures.Future[str]":
+        future: "concurrent.futures.Future[str]" = concurrent.futures.Future()
+        future.set_result(html)
+        return future
 
     def markdown_to_html_enhanced(self, md: str) -> str:
         """Enhanced markdown to HTML converter"""
-        import re
+        # Plain-text narratives (no markdown markers) only need paragraph wrapping
+        if _MARKDOWN_CHARS.isdisjoint(md) and "<li>" not in md:
+            return self._wrap_paragraphs(md)
 
         # Convert markdown headers
         html = re.sub(r"^# (.+)$", r"<h1>\1</h1>", md, flags=re.MULTILINE)
@@ -420,16 +534,16 @@ class Agent:
         html = re.sub(r"^- (.+)$", r"<li>\1</li>", html, flags=re.MULTILINE)
         html = re.sub(r"(<li>.*</li>)", r"<ul>\1</ul>", html, flags=re.DOTALL)
 
-        # Convert paragraphs (split by double newlines)
-        parts = [p.strip() for p in html.split("\n\n") if p.strip()]
-        paragraphs = []
-        for part in parts:
-            if not any(tag in part for tag in ["<h1>", "<h2>", "<h3>", "<ul>", "<li>"]):
-                paragraphs.append(f"<p>{part}</p>")
-            else:
-                paragraphs.append(part)
+        return self._wrap_paragraphs(html)
 
-        return "".join(paragraphs)
+    @staticmethod
+    def _wrap_paragraphs(html: str) -> str:
+        # Convert paragraphs (split by double newlines), stripping each part once
+        return "".join(
+            f"<p>{part}</p>" if _BLOCK_TAG_RE.search(part) is None else part
+            for part in map(str.strip, html.split("\n\n"))
+            if part
+        )
 
     def process(self):
         """Execute the complete workflow"""
@@ -445,7 +559,11 @@ class Agent:
 
         # Invoke the workflow (Steps 1-3)
         print("Starting research workflow...")
-        output_state = self.workflow.invoke(state)  # type: ignore
+        try:
+            output_state = self.workflow.invoke(state)  # type: ignore
+        finally:
+            # Release the thread pools the researcher shared across steps
+            self.researcher.close()  # type: ignore
 
         # Flatten the output
         def _flatten(value):
@@ -454,13 +572,13 @@ class Agent:
         result = {k: _flatten(v) for k, v in output_state.items()}
 
         # Step 4: Generate HTML output deterministically
-        html_content = self.decode_output(result)
+        self.decode_output(result)
 
         print("\n=== Workflow Completed ===")
         print(
             f"Generated research questions: {len(result.get('research_questions', []))}"
         )
         print(f"Completed analyses: {len(result.get('research_results', []))}")
-        print(f"HTML report saved: output.html")
+        print(f"HTML report saved: {self.output_path}")
 
         return result
@@ -7,11 +7,12 @@ from openai import AzureOpenAI, OpenAI
 load_dotenv()
 
 
-def get_llm(**kw):
+def get_llm(model=None, **kw):
     """
     Return a Chat‑compatible LLM whose backend (OpenAI, Azure, local stub…)
     is selected by env‑vars.  Extra **kw flow through so nodes can override
-    temperature, max_tokens, etc. without knowing the backend.
+    temperature, max_tokens, etc. without knowing the backend. `model`
+    overrides the configured model (Azure deployment) for this client only.
 
     Mini challenge evaluation server uses azure openai to run your submission.
     You don't need to fill in the azure openai endpoint and api key,
@@ -23,9 +24,9 @@ def get_llm(**kw):
         return AzureChatOpenAI(
             azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
             api_key=os.environ["AZURE_OPENAI_API_KEY"],
-            deployment_name=os.getenv(
-                "AZURE_OPENAI_DEPLOYMENT", "gpt-4o"
-            ),  # For submission, the default value is always gpt-4o, but you can choose from o1, o3 and o4-mini too.
+            # For submission, the default value is always gpt-4o, but you can
+            # choose from o1, o3 and o4-mini too.
+            deployment_name=model or os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview"),
             **kw,
         )
@@ -36,6 +37,6 @@ def get_llm(**kw):
     else:
         return ChatOpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
-            model_name=os.getenv("OPENAI_MODEL", "gpt-4o"),
+            model_name=model or os.getenv("OPENAI_MODEL", "gpt-4o"),
             **kw,
         )
@@ -16,8 +16,8 @@ def markdown_to_html(md: str) -> str:
     # italics
     html = re.sub(r"\*(.+?)\*", r"<em>\1</em>", html)
     # paragraphs
-    parts = [p.strip() for p in html.split("\n\n") if p.strip()]
-    return "\n".join(f"<p>{p}</p>" for p in parts)
+    parts = map(str.strip, html.split("\n\n"))
+    return "\n".join(f"<p>{p}</p>" for p in parts if p)
 
 
 def generate_html_report(output_state: dict, output_path: str):
@@ -1,30 +1,83 @@
-from typing import Any, Counter, Dict, List
-
+import functools
+import gc
+import json
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from types import CodeType
+from typing import Any, Dict, Tuple
+
+import matplotlib
+import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from utils.file_operation import save_json_data
 
+matplotlib.use("Agg")  # Use non-interactive backend
+warnings.filterwarnings("ignore", message="FigureCanvasAgg is non-interactive")
 
-def convert_numpy_types(obj):
-    """Convert numpy types to Python native types for JSON serialization"""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    else:
-        return obj
 
+# Chart PNGs favour encode speed over file size
+_PNG_SAVE_OPTIONS = {"compress_level": 1}
 
-def chunk_list(lst: List[Any], batch_size: int):
-    """Split a list into batches of specified size"""
-    for i in range(0, len(lst), batch_size):
-        yield lst[i : i + batch_size]
+# Guards exec() of generated code together with the pyplot figures it creates
+_EXEC_LOCK = threading.Lock()
+
+# Parsed CSVs keyed by (path, mtime), so an edited file is parsed again
+_DF_CACHE: Dict[Tuple[str, float], pd.DataFrame] = {}
+# Serializes misses, so concurrent research threads parse a file only once
+_DF_CACHE_LOCK = threading.Lock()
+
+
+def _load_df(path: str, copy: bool = True) -> pd.DataFrame:
+    """
+    Return the parsed CSV, parsing it only once per version.
+
+    The frame is a private copy unless copy=False, which read-only callers
+    use to avoid duplicating the whole dataset.
+    """
+    key = (path, os.path.getmtime(path))
+    df = _DF_CACHE.get(key)
+    if df is None:
+        with _DF_CACHE_LOCK:
+            # Another thread may have parsed it while we waited for the lock
+            df = _DF_CACHE.get(key)
+            if df is None:
+                # Default C parser, as in the agent's profile: the pyarrow
+                # engine would type date-like columns differently from what
+                # the profile describes
+                df = pd.read_csv(path)
+                # Drop frames parsed from older versions of the same file
+                for stale_key in [k for k in _DF_CACHE if k[0] == path]:
+                    _DF_CACHE.pop(stale_key, None)
+                _DF_CACHE[key] = df
+    # Executed queries may modify df in place, so they never get the cached frame
+    return df.copy() if copy else df
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_query(query: str) -> CodeType:
+    """Compile generated pandas code once per distinct query string"""
+    return compile(query, "<pandas_query>", "exec")
+
+
+def _summarize_column(values: pd.Series) -> Dict[str, Any]:
+    """Summarize a single column's examples, cardinality and top frequencies"""
+    # One hashing pass: uniques come back in order of appearance and the
+    # codes index into them, so counts fall out of a bincount
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = uniques.tolist()
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    top = np.argsort(-counts, kind="stable")[:5]
+
+    return {
+        # First 10 distinct values, in order of appearance
+        "examples": uniques[:10],
+        "unique_value_count": len(uniques),
+        "top_frequencies": {uniques[i]: int(counts[i]) for i in top},
+    }
 
 
 def generate_dataset_summary(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -38,61 +91,48 @@ def generate_dataset_summary(state: Dict[str, Any]) -> Dict[str, Any]:
     if not isinstance(attributes, list):
         raise ValueError("Attributes must be a list")
 
-    summaries = {}
-    for attribute in attributes:
-        values = [row.get(attribute, None) for row in dataset_rows if attribute in row]
-        values = [v for v in values if v is not None]  # Remove nulls
-
-        all_examples = []
-        counter = Counter()
-
-        batches = chunk_list(values, batch_size=10)
-        for batch in batches:
-            counter.update(batch)
-            all_examples.extend(batch)
-
-        # Deduplicate and truncate to 10 representative examples
-        unique_examples = []
-        seen = set()
-        for v in all_examples:
-            if v not in seen:
-                seen.add(v)
-                unique_examples.append(v)
-            if len(unique_examples) == 10:
-                break
-
-        # Final summary for the column
-        summaries[attribute] = {
-            "column_name": attribute,
-            "examples": unique_examples,
-            "unique_value_count": len(set(values)),
-            "top_frequencies": dict(counter.most_common(5)),
-        }
+    # Let pandas do the per-column counting in C instead of row-by-row in Python
+    # Only the declared attributes are built; ones missing from every row come
+    # back as all-NaN columns
+    df = pd.DataFrame.from_records(dataset_rows, columns=attributes)
+
+    # Columns are independent, and pandas' hashing releases the GIL
+    columns = [df[attribute] for attribute in attributes]
+    if len(columns) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(columns))) as executor:
+            column_summaries = list(executor.map(_summarize_column, columns))
+    else:
+        column_summaries = [_summarize_column(values) for values in columns]
+
+    summaries = {
+        attribute: {"column_name": attribute, **column_summary}
+        for attribute, column_summary in zip(attributes, column_summaries)
+    }
 
     # Save dataset summary
     output_dir = "./datasets"
     save_json_data(summaries, "00_dataset_summary.json", output_dir)
 
     # Return updated state with dataset_summary added
-    updated_state = state.copy()
-    updated_state["dataset_summary"] = summaries
-    return updated_state
+    return {**state, "dataset_summary": summaries}
 
 
 def sample_data(columns, sample_size):
-    # Use main dataset
-    import os
-
+    # Use main dataset; sampling only reads columns, so skip the defensive copy
     if os.path.exists("dataset.csv"):
-        df = pd.read_csv("dataset.csv")
+        df = _load_df("dataset.csv", copy=False)
     else:
-        df = pd.read_csv("synthetic_dataset.csv")
+        df = _load_df("synthetic_dataset.csv", copy=False)
 
+    # Sample straight from the column arrays rather than dropna() Series copies
+    rng = np.random.default_rng()
     samples = {}
     for col in columns:
         if col in df.columns:
-            n_samples = min(sample_size, len(df[col].dropna()))
-            samples[col] = df[col].dropna().sample(n=n_samples).tolist()
+            values = df[col].to_numpy()
+            values = values[~pd.isna(values)]
+            n_samples = min(sample_size, values.size)
+            samples[col] = rng.choice(values, size=n_samples, replace=False).tolist()
 
     return samples
 
@@ -110,22 +150,8 @@ def execute_pandas_query_for_computation(
     Returns:
         Dict containing computed data, chart path, and execution metadata
     """
-    import gc
-    import warnings
-
-    import matplotlib
-    import pandas as pd
-
-    matplotlib.use("Agg")  # Use non-interactive backend
-    warnings.filterwarnings("ignore", message="FigureCanvasAgg is non-interactive")
-    import os
-    import time
-
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-
     # Load the dataset
-    df = pd.read_csv("dataset.csv")
+    df = _load_df("dataset.csv")
 
     # Create unique chart filename
     timestamp = str(int(time.time() * 1000))
@@ -138,31 +164,43 @@ def execute_pandas_query_for_computation(
     local_namespace = {
         "df": df,
         "pd": pd,
-        "plt": plt,
-        "sns": sns,
         "chart_path": chart_path,
     }
+    # Most queries only aggregate; seaborn is heavy, so import it on demand
+    if "plt" in query or "sns" in query or "plot(" in query:
+        import seaborn as sns
+
+        local_namespace["plt"] = plt
+        local_namespace["sns"] = sns
 
     chart_generated = False
     result_data = None
 
     try:
-        # Execute the pandas code (JIT computation happens here)
-        exec(query, globals(), local_namespace)
-
-        # Check if any plots were created
-        if plt.get_fignums():
-            # Save all figures
-            for i, fig_num in enumerate(plt.get_fignums()):
-                fig = plt.figure(fig_num)
-                if i == 0:
-                    fig.savefig(chart_path, dpi=150, bbox_inches="tight")
-                    chart_generated = True
-                else:
-                    # Save additional figures with different names
-                    additional_path = f"visualizations/chart_{timestamp}_{i}.png"
-                    fig.savefig(additional_path, dpi=150, bbox_inches="tight")
-                plt.close(fig)
+        # Generated code runs in parallel question threads, but pyplot's figure
+        # registry is process-global; serialize execution so one query never
+        # saves or closes another's figures. Only the LLM calls overlap.
+        with _EXEC_LOCK:
+            # Execute the pandas code (JIT computation happens here)
+            exec(_compile_query(query), globals(), local_namespace)
+
+            # Check if any plots were created
+            if plt.get_fignums():
+                # Save all figures
+                for i, fig_num in enumerate(plt.get_fignums()):
+                    fig = plt.figure(fig_num)
+                    # One layout pass instead of bbox_inches="tight"'s re-render
+                    fig.tight_layout()
+                    if i == 0:
+                        fig.savefig(chart_path, dpi=96, pil_kwargs=_PNG_SAVE_OPTIONS)
+                        chart_generated = True
+                    else:
+                        # Save additional figures with different names
+                        additional_path = f"visualizations/chart_{timestamp}_{i}.png"
+                        fig.savefig(
+                            additional_path, dpi=96, pil_kwargs=_PNG_SAVE_OPTIONS
+                        )
+                    plt.close(fig)
 
         # Get the result variable (computed on-demand)
         if "result" in local_namespace:
@@ -174,10 +212,8 @@ def execute_pandas_query_for_computation(
                     # This is a DataFrame - NOTE: computation already used all data
                     if len(result) > 100:
                         # Sample OUTPUT data for large results to save memory (computation was on full data)
-                        sampled_result = (
-                            result.head(50).append(result.tail(50))
-                            if len(result) > 100
-                            else result
+                        sampled_result = pd.concat(
+                            [result.iloc[:50], result.iloc[-50:]]
                         )
                         result_data = {
                             "sampled_data": sampled_result.to_dict("records"),
@@ -191,7 +227,7 @@ def execute_pandas_query_for_computation(
                     # This is a Series or other pandas object
                     if hasattr(result, "__len__") and len(result) > 1000:
                         result_data = {
-                            "sampled_data": result.head(1000).tolist(),
+                            "sampled_data": result.iloc[:1000].tolist(),
                             "total_length": len(result),
                             "note": f"Computation used all {len(result)} items, output sampled for display",
                             "computation_complete": True,
@@ -232,8 +268,9 @@ def execute_pandas_query_for_computation(
         }
 
     except Exception as e:
-        # Close any open figures in case of error
-        plt.close("all")
+        # Close any open figures in case of error, once no query is mid-plot
+        with _EXEC_LOCK:
+            plt.close("all")
         # Memory cleanup on error
         if ephemeral:
             gc.collect()
@@ -253,27 +290,20 @@ def execute_pandas_query_for_synthetic_dataset(
     Returns:
         pd.DataFrame: The modified dataset with new synthetic column(s)
     """
-    import json
-
-    import numpy as np
-    import pandas as pd
-
     # Create execution environment with the passed dataset
     local_namespace = {"df": dataset, "pd": pd, "np": np, "json": json}
 
     try:
         # Execute the pandas code (modifies df in-place)
-        exec(query, globals(), local_namespace)
+        exec(_compile_query(query), globals(), local_namespace)
 
         # Get the modified DataFrame
         result_df = local_namespace["df"]
 
         # Convert numpy types to avoid JSON serialization issues later
-        for col in result_df.columns:
-            if result_df[col].dtype == "int64":
-                result_df[col] = result_df[col].astype("object")
-            elif result_df[col].dtype == "float64":
-                result_df[col] = result_df[col].astype("object")
+        numeric_cols = result_df.select_dtypes(include=["int64", "float64"]).columns
+        if len(numeric_cols):
+            result_df[numeric_cols] = result_df[numeric_cols].astype("object")
 
         return result_df
 
@@ -1,56 +1,271 @@
 """File operation utilities for caching and data persistence."""
 
+import atexit
+import functools
 import json
+import mmap
 import os
-from typing import Any, Dict, Optional
+import pickle
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional speedup; load_cached_json() skips the sidecar
+    msgpack = None
+
+_ORJSON_OPTIONS = (
+    orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if orjson is not None
+    else 0
+)
+
+# Cache files above this size are parsed through mmap instead of read(), and
+# get a msgpack sidecar when msgpack is installed
+_MMAP_MIN_SIZE = 256 * 1024
+_SIDECAR_SUFFIX = ".msgpack"
+
+# Patterns used by clean_markdown_output(). The inline ones cannot cross a
+# closing delimiter or a line break, so they never backtrack past it
+_CODE_BLOCK_RE = re.compile(
+    r"```(?:python|json|javascript|html|css)?\s*\n?(.*?)\n?```", re.DOTALL
+)
+_BOLD_RE = re.compile(r"\*\*[^*\n]*?\*\*")
+_ITALIC_RE = re.compile(r"\*[^*\n]*?\*")
+_INLINE_CODE_RE = re.compile(r"`[^`\n]*?`")
+_LINK_RE = re.compile(r"!?\[[^\]\n]*\]\([^)\n]*\)")  # links and images
+_BLANK_LINES_RE = re.compile(r"(?:\r?\n)\s*(?:\r?\n)+")
+
+# Line filters used by clean_markdown_output() when there is no code block
+_MD_PREFIXES = ("#", "*", "-", "```", ">", "|")
+_PANDAS_TOKENS = ("=", "df.", "result")
+_JSON_TOKENS = ("{", "}", '"', ":")
+
+# Root of the prompt templates (studio/prompts), resolved once at import
+_PROMPTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts"
+)
+
+# Directories save_json_data() has already created in this process
+_ENSURED_DIRS: Set[str] = set()
+
+# load_cached_json() snapshots: path -> ((mtime_ns, size), pickled data)
+_JSON_MEMO: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+_JSON_MEMO_LOCK = threading.Lock()
+
+# Background writer for cache files; pending writes are flushed at exit
+_IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-io")
+atexit.register(_IO_POOL.shutdown, wait=True)
 
 
 def load_cached_json(
     file_path: str, dataset_dir: str = "./datasets"
 ) -> Optional[Dict[str, Any]]:
-    """Load cached JSON data if it exists."""
+    """
+    Load cached JSON data if it exists.
+
+    Parsed files are memoized by path and (mtime_ns, size), so a rewritten
+    file is picked up without any invalidation; missing files are not
+    memoized. Every call returns a private copy that callers may modify.
+    """
     full_path = os.path.join(dataset_dir, file_path)
-    if os.path.exists(full_path):
-        with open(full_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    try:
+        f = open(full_path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        stat = os.fstat(f.fileno())
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        # Unpickling the memoized snapshot is a fast deep copy
+        with _JSON_MEMO_LOCK:
+            memo = _JSON_MEMO.get(full_path)
+        if memo is not None and memo[0] == version:
+            return pickle.loads(memo[1])
+
+        # A msgpack sidecar recorded against this exact version of a large
+        # JSON skips decoding across runs
+        sidecar_path = full_path + _SIDECAR_SUFFIX
+        data = _read_sidecar(sidecar_path, version)
+        if data is None:
+            if orjson is not None and stat.st_size > _MMAP_MIN_SIZE:
+                # Parse large caches straight out of the page cache, without
+                # first copying the whole file into a bytes object
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        data = _decode_json(view)
+            else:
+                data = _decode_json(f.read())
+            if msgpack is not None and stat.st_size > _MMAP_MIN_SIZE:
+                _write_sidecar(sidecar_path, version, data)
+        snapshot = pickle.dumps(data, protocol=5)
+
+    with _JSON_MEMO_LOCK:
+        _JSON_MEMO[full_path] = (version, snapshot)
+    return data
+
+
+def _read_sidecar(sidecar_path: str, version: Tuple[int, int]) -> Any:
+    """
+    Return the data in a [version, data] msgpack sidecar, if it is fresh.
+
+    version is the source JSON's (st_mtime_ns, st_size), so a sidecar written
+    from an older JSON is never returned, whatever its own mtime. msgpack only
+    decodes plain data, so a tampered sidecar cannot run code.
+    """
+    if msgpack is None:
+        return None
+    try:
+        with open(sidecar_path, "rb") as sf:
+            sidecar_version, data = msgpack.unpackb(sf.read(), strict_map_key=False)
+    except (OSError, ValueError, TypeError, msgpack.UnpackException):
+        return None  # missing or unreadable sidecar; fall back to the JSON
+    if tuple(sidecar_version) != version:
+        return None
+    return data
+
+
+def _write_sidecar(sidecar_path: str, version: Tuple[int, int], data: Any) -> None:
+    try:
+        payload = msgpack.packb([version, data])
+    except (TypeError, ValueError, OverflowError):
+        return  # values msgpack cannot represent (e.g. huge ints); JSON only
+    try:
+        _write_atomic(sidecar_path, payload)
+    except OSError:
+        pass  # the sidecar is only a speedup
+
+
+def _decode_json(raw: Union[bytes, memoryview]) -> Any:
+    """Parse JSON from bytes or a buffer, preferring orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # orjson is strict; files written by the stdlib encoder may hold NaN
+    return json.loads(bytes(raw))
+
+
+def _np_default(obj: Any) -> Any:
+    """json default= hook converting numpy values to Python native types"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 def save_json_data(
     data: Dict[str, Any], file_path: str, dataset_dir: str = "./datasets"
 ) -> None:
-    """Save data to JSON file with proper encoding and numpy type conversion."""
-    import numpy as np
-
-    def convert_numpy_types(obj):
-        """Convert numpy types to Python native types for JSON serialization"""
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_numpy_types(item) for item in obj]
-        else:
-            return obj
-
-    # Convert numpy types before saving
-    clean_data = convert_numpy_types(data)
-
-    os.makedirs(dataset_dir, exist_ok=True)
+    """
+    Save data to JSON file with proper encoding and numpy type conversion.
+
+    With orjson, NaN and infinities are written as null and load back as None;
+    callers that compare fresh and cached data should use None for missing
+    values. The stdlib fallback keeps writing NaN/Infinity literals.
+    """
+    if dataset_dir not in _ENSURED_DIRS:
+        os.makedirs(dataset_dir, exist_ok=True)
+        _ENSURED_DIRS.add(dataset_dir)
     full_path = os.path.join(dataset_dir, file_path)
-    with open(full_path, "w", encoding="utf-8") as f:
-        json.dump(clean_data, f, indent=2, ensure_ascii=False)
+
+    # The sidecar written by load_cached_json() is stale from here on
+    try:
+        os.remove(full_path + _SIDECAR_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+    # orjson serializes numpy scalars and arrays natively, so the data can be
+    # written as-is without first copying the whole tree
+    payload = None
+    if orjson is not None:
+        try:
+            payload = orjson.dumps(data, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass  # types orjson rejects go through the stdlib encoder
+
+    if payload is None:
+        # The encoder walks the tree in C and only calls back for numpy
+        # leaves; encoding up front turns the save into one binary write
+        payload = json.dumps(
+            data, indent=2, ensure_ascii=False, default=_np_default
+        ).encode("utf-8")
+
+    _write_atomic(full_path, payload)
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    """Write a file via a sibling temp file, so readers never see it half-written"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_json_data_async(
+    data: Dict[str, Any], file_path: str, dataset_dir: str = "./datasets"
+) -> Future:
+    """Queue save_json_data on a background thread so the caller can move on."""
+    future = _IO_POOL.submit(save_json_data, data, file_path, dataset_dir)
+    future.add_done_callback(_report_save_error)
+    return future
 
 
+def _report_save_error(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        print(f"Error saving cached data: {error}")
+
+
+def dumps_json(data: Any, compact: bool = False) -> str:
+    """
+    Serialize data to JSON text, using orjson when it is installed.
+
+    Output is indented by default; compact=True drops all insignificant
+    whitespace, which roughly halves the size of payloads sent to the LLM.
+    """
+    if orjson is not None:
+        options = _ORJSON_OPTIONS & ~orjson.OPT_INDENT_2 if compact else _ORJSON_OPTIONS
+        try:
+            return orjson.dumps(data, option=options).decode("utf-8")
+        except TypeError:
+            pass  # types orjson rejects go through the stdlib encoder
+    if compact:
+        return json.dumps(
+            data, separators=(",", ":"), ensure_ascii=False, default=_np_default
+        )
+    return json.dumps(data, indent=2, ensure_ascii=False, default=_np_default)
+
+
+@functools.lru_cache(maxsize=128)
 def load_prompt_template(directory: str, file_name: str) -> str:
-    """Load prompt template with proper encoding."""
-    curr_dir = os.path.dirname(os.path.abspath(__file__))
-    prompt_dir = os.path.join(os.path.dirname((curr_dir)), "prompts", directory)
-    full_path = os.path.join(prompt_dir, file_name)
+    """
+    Load prompt template with proper encoding.
+
+    Templates are read once per process; call load_prompt_template.cache_clear()
+    after editing prompt files in a running session.
+    """
+    full_path = os.path.join(_PROMPTS_DIR, directory, file_name)
     try:
         with open(full_path, "r", encoding="utf-8") as f:
             return f.read()
@@ -58,21 +273,6 @@ def load_prompt_template(directory: str, file_name: str) -> str:
         raise FileNotFoundError(f"Prompt file not found: {full_path}")
 
 
-def read_csv_data(csv_path: str) -> Dict[str, Any]:
-    """Read CSV data and return structured information."""
-    import csv
-
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        data_rows = list(reader)
-
-        return {
-            "headers": reader.fieldnames or [],
-            "data": data_rows,
-            "num_rows": len(data_rows),
-        }
-
-
 def clean_markdown_output(llm_output: str, output_type: str = "generic") -> str:
     """
     Clean markdown output from LLM and extract the relevant content.
@@ -91,11 +291,8 @@ def clean_markdown_output(llm_output: str, output_type: str = "generic") -> str:
         Input: "```json\n{\"$schema\": \"...\"}\n```"
         Output: "{\"$schema\": \"...\"}"
     """
-    import re
-
     # Remove markdown code blocks (```python, ```json, ```, etc.)
-    code_block_pattern = r"```(?:python|json|javascript|html|css)?\s*\n?(.*?)\n?```"
-    code_match = re.search(code_block_pattern, llm_output, re.DOTALL)
+    code_match = _CODE_BLOCK_RE.search(llm_output)
 
     if code_match:
         # Extract code from code block
@@ -108,54 +305,31 @@ def clean_markdown_output(llm_output: str, output_type: str = "generic") -> str:
         for line in lines:
             line = line.strip()
             # Skip empty lines, markdown formatting, and explanatory text
-            if (
-                line
-                and not line.startswith("#")
-                and not line.startswith("**")
-                and not line.startswith("*")
-                and not line.startswith("-")
-                and not line.startswith("##")
-                and not line.startswith("```")
-                and not line.startswith(">")
-                and not line.startswith("|")
-            ):
-                # For pandas queries, look for specific patterns
-                if output_type == "pandas" and (
-                    "=" in line or "df." in line or "result" in line
-                ):
-                    content_lines.append(line)
-                # For Vega-Lite/JSON, look for JSON-like patterns
-                elif output_type in ["vegalite", "json"] and (
-                    "{" in line or "}" in line or '"' in line or ":" in line
-                ):
-                    content_lines.append(line)
-                # For generic output, include lines that look like code/content
-                elif output_type == "generic" and (
-                    "=" in line
-                    or "{" in line
-                    or "}" in line
-                    or "[" in line
-                    or "]" in line
-                ):
+            if not line or line.startswith(_MD_PREFIXES):
+                continue
+            # For pandas queries, look for specific patterns
+            if output_type == "pandas":
+                if any(token in line for token in _PANDAS_TOKENS):
                     content_lines.append(line)
-                # For generic output, also include lines that don't look like markdown
-                elif output_type == "generic" and not any(
-                    line.startswith(prefix)
-                    for prefix in ["#", "**", "*", "-", "##", "```", ">", "|"]
-                ):
+            # For Vega-Lite/JSON, look for JSON-like patterns
+            elif output_type in ("vegalite", "json"):
+                if any(token in line for token in _JSON_TOKENS):
                     content_lines.append(line)
+            # For generic output, every line that doesn't look like markdown
+            # (which includes any code/content lines) is kept
+            elif output_type == "generic":
+                content_lines.append(line)
 
         content = "\n".join(content_lines)
 
     # Clean up any remaining markdown artifacts
-    content = re.sub(r"\*\*.*?\*\*", "", content)  # Remove bold text
-    content = re.sub(r"\*.*?\*", "", content)  # Remove italic text
-    content = re.sub(r"`.*?`", "", content)  # Remove inline code
-    content = re.sub(r"\[.*?\]\(.*?\)", "", content)  # Remove links
-    content = re.sub(r"!\[.*?\]\(.*?\)", "", content)  # Remove images
+    content = _BOLD_RE.sub("", content)  # Remove bold text
+    content = _ITALIC_RE.sub("", content)  # Remove italic text
+    content = _INLINE_CODE_RE.sub("", content)  # Remove inline code
+    content = _LINK_RE.sub("", content)  # Remove links and images
 
     # Remove any leading/trailing whitespace and empty lines
-    content = "\n".join(line for line in content.split("\n") if line.strip())
+    content = _BLANK_LINES_RE.sub("\n", content).strip()
 
     return content
 
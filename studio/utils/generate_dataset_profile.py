@@ -1,8 +1,29 @@
-from typing import Any, Dict, Union
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Union
 
 import numpy as np
 import pandas as pd
 
+# d_type for each numpy/pandas dtype.kind ("O" covers object and string columns)
+_DTYPE_KINDS = {
+    "i": "int",
+    "u": "int",
+    "f": "float",
+    "b": "bool",
+    "M": "datetime",
+    "m": "datetime",
+    "O": "object",
+}
+
+# Semantic type for the d_types that need no look at the data
+_SEMANTIC_TYPES = {
+    "datetime": "temporal",
+    "bool": "categorical",
+    "category": "categorical",
+    "object": "mixed",  # Mixed types or complex objects
+}
+
 
 def extract_dtype_info(series: pd.Series) -> Dict[str, Any]:
     """
@@ -12,36 +33,41 @@ def extract_dtype_info(series: pd.Series) -> Dict[str, Any]:
     # Get the actual pandas dtype
     pandas_dtype = str(series.dtype)
 
-    # Handle numpy dtypes and convert to readable format
-    if "int" in pandas_dtype:
-        d_type = "int"
-    elif "float" in pandas_dtype:
-        d_type = "float"
-    elif "bool" in pandas_dtype:
-        d_type = "bool"
-    elif "datetime" in pandas_dtype or "time" in pandas_dtype:
-        d_type = "datetime"
-    elif "category" in pandas_dtype:
+    # Handle numpy dtypes and convert to readable format; categoricals report
+    # kind "O", so they are told apart before the kind lookup
+    if isinstance(series.dtype, pd.CategoricalDtype):
         d_type = "category"
-    elif "object" in pandas_dtype:
-        # Check if it's actually string data
-        if series.dropna().apply(lambda x: isinstance(x, str)).all():
-            d_type = "string"
-        else:
-            d_type = "object"
     else:
-        d_type = "unknown"
+        d_type = _DTYPE_KINDS.get(series.dtype.kind, "unknown")
+    if d_type == "object":
+        # Check if it's actually string data; infer_dtype scans in C and stops
+        # at the first non-string ("empty" when there is nothing but nulls)
+        if pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty"):
+            d_type = "string"
 
     return {"d_type": d_type, "pandas_dtype": pandas_dtype}
 
 
-def infer_data_type(series: pd.Series, d_type: str) -> str:
+def infer_data_type(
+    series: pd.Series,
+    d_type: str,
+    distinct_count: Optional[int] = None,
+    non_null_count: Optional[int] = None,
+) -> str:
     """
     Infer the semantic type of the data for analysis purposes.
+
+    distinct_count and non_null_count may be passed in when the caller has
+    already computed them, to avoid rescanning the series.
     """
+    if distinct_count is None:
+        distinct_count = series.nunique()
+    if non_null_count is None:
+        non_null_count = series.count()
+
     if d_type in ["int", "float"]:
         # Check if it's actually categorical despite being numeric
-        unique_ratio = series.nunique() / len(series.dropna())
+        unique_ratio = distinct_count / non_null_count
         if unique_ratio < 0.1:  # Less than 10% unique values
             return "categorical"
         elif d_type == "int" and series.min() >= 0 and series.max() <= 100:
@@ -49,16 +75,13 @@ def infer_data_type(series: pd.Series, d_type: str) -> str:
             return "continuous"
         else:
             return "continuous"
-    elif d_type == "datetime":
-        return "temporal"
-    elif d_type == "bool":
-        return "categorical"
-    elif d_type == "category":
-        return "categorical"
     elif d_type == "string":
         # Check if it's text or categorical
-        unique_ratio = series.nunique() / len(series.dropna())
-        avg_length = series.dropna().str.len().mean()
+        unique_ratio = distinct_count / non_null_count
+        # The 50-character text threshold is a heuristic, so the average
+        # length of the first 1024 values is as good as the exact one
+        sample = series.dropna().head(1024)
+        avg_length = sample.str.len().to_numpy().mean() if sample.size else 0
 
         if unique_ratio < 0.3:  # Less than 30% unique values
             return "categorical"
@@ -66,45 +89,46 @@ def infer_data_type(series: pd.Series, d_type: str) -> str:
             return "text"
         else:
             return "categorical"
-    elif d_type == "object":
-        # Mixed types or complex objects
-        return "mixed"
     else:
-        return "unknown"
+        return _SEMANTIC_TYPES.get(d_type, "unknown")
 
 
 def get_numeric_stats(series: pd.Series) -> Dict[str, Any]:
     """
     Extract comprehensive numeric statistics for continuous variables.
     """
-    # Remove infinite values for calculations
-    clean_series = series.replace([np.inf, -np.inf], np.nan)
+    # One float view of the data; every statistic below reads from it
+    values = series.to_numpy(dtype=float, na_value=np.nan)
 
     stats = {}
 
     # Count infinite values
-    infinite_mask = np.isinf(series)
-    infinite_count = infinite_mask.sum()
-    infinite_percentage = (infinite_count / len(series)) * 100
+    infinite_count = int(np.count_nonzero(np.isinf(values)))
+    infinite_percentage = (infinite_count / len(values)) * 100
 
     stats.update(
         {
-            "infinite_values": int(infinite_count),
+            "infinite_values": infinite_count,
             "infinite_values_percentage": round(infinite_percentage, 2),
         }
     )
 
     # Basic statistics (only on finite values)
-    if len(clean_series.dropna()) > 0:
+    finite = values[np.isfinite(values)]
+    if finite.size > 0:
+        # A single sort serves min, max and all three quartiles
+        low, q25, median, q75, high = np.percentile(finite, [0, 25, 50, 75, 100])
         stats.update(
             {
-                "mean": float(clean_series.mean()),
-                "median": float(clean_series.median()),
-                "std": float(clean_series.std()),
-                "min": float(clean_series.min()),
-                "max": float(clean_series.max()),
-                "q25": float(clean_series.quantile(0.25)),
-                "q75": float(clean_series.quantile(0.75)),
+                "mean": float(finite.mean()),
+                "median": float(median),
+                # Sample standard deviation, as pandas computes it; undefined
+                # (None, which is what the JSON cache would hand back) for one value
+                "std": float(finite.std(ddof=1)) if finite.size > 1 else None,
+                "min": float(low),
+                "max": float(high),
+                "q25": float(q25),
+                "q75": float(q75),
             }
         )
     else:
@@ -136,53 +160,117 @@ def generate_dataset_profile(
     Returns:
         Dictionary with column names as keys and their profiles as values
     """
-    profile = {}
     total_rows = len(df)
 
-    for column in df.columns:
-        series = df[column]
-
-        # Basic counts
-        missing_count = series.isnull().sum()
-        missing_percentage = (missing_count / total_rows) * 100
-        distinct_count = series.nunique(dropna=True)
-        distinct_percentage = (
-            (distinct_count / (total_rows - missing_count)) * 100
-            if (total_rows - missing_count) > 0
-            else 0
+    # Frame-wide aggregations, computed once instead of per column
+    missing_counts = df.isnull().sum()
+
+    def profile_column(column: Any) -> Dict[str, Any]:
+        return _profile_column(
+            df[column], total_rows, int(missing_counts[column]), top_k
         )
 
-        # Get dtype information
-        dtype_info = extract_dtype_info(series)
-        d_type = dtype_info["d_type"]
-
-        # Infer semantic type
-        type_inferred = infer_data_type(series, d_type)
-
-        # Top frequencies (exclude NaN)
-        top_freqs = series.value_counts(dropna=True).head(top_k).to_dict()
-
-        # Examples (convert to strings, exclude NaN)
-        examples = series.dropna().astype(str).unique()[:top_k].tolist()
-
-        # Initialize column profile
-        column_profile = {
-            "total_rows": total_rows,
-            "distinct_values": int(distinct_count),
-            "distinct_values_percentage": round(distinct_percentage, 2),
-            "missing_values": int(missing_count),
-            "missing_values_percentage": round(missing_percentage, 2),
-            "d_type": d_type,
-            "type_inferred": type_inferred,
-            "top_frequencies": top_freqs,
-            "examples": examples,
-        }
+    # Columns are independent and their value_counts/percentile work runs in
+    # pandas/numpy C code that releases the GIL
+    columns = list(df.columns)
+    if len(columns) > 1:
+        max_workers = min(32, os.cpu_count() or 4, len(columns))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(columns, executor.map(profile_column, columns)))
+    return {column: profile_column(column) for column in columns}
+
+
+def _profile_column(
+    series: pd.Series, total_rows: int, missing_count: int, top_k: int
+) -> Dict[str, Any]:
+    """Profile a single column for generate_dataset_profile()"""
+    # Basic counts
+    non_null_count = total_rows - missing_count
+    missing_percentage = (missing_count / total_rows) * 100
+    # One hash table per column serves the distinct count, the top
+    # frequencies and the examples
+    value_counts = series.value_counts(dropna=True)
+    distinct_count = int(value_counts.size)
+    distinct_percentage = (
+        (distinct_count / non_null_count) * 100 if non_null_count > 0 else 0
+    )
+
+    # Get dtype information
+    dtype_info = extract_dtype_info(series)
+    d_type = dtype_info["d_type"]
+
+    # Infer semantic type
+    type_inferred = infer_data_type(
+        series, d_type, distinct_count=distinct_count, non_null_count=non_null_count
+    )
+
+    # Top frequencies (exclude NaN)
+    top_freqs = value_counts.head(top_k).to_dict()
+
+    # Examples: the most frequent values, as strings
+    examples = [str(value) for value in value_counts.index[:top_k].tolist()]
+
+    # Initialize column profile
+    column_profile = {
+        "total_rows": total_rows,
+        "distinct_values": distinct_count,
+        "distinct_values_percentage": round(distinct_percentage, 2),
+        "missing_values": missing_count,
+        "missing_values_percentage": round(missing_percentage, 2),
+        "d_type": d_type,
+        "type_inferred": type_inferred,
+        "top_frequencies": top_freqs,
+        "examples": examples,
+    }
+
+    # Add numeric statistics for continuous variables
+    if type_inferred in ["continuous", "numeric"] and d_type in ["int", "float"]:
+        numeric_stats = get_numeric_stats(series)
+        column_profile.update(numeric_stats)
+
+    return column_profile
+
 
-        # Add numeric statistics for continuous variables
-        if type_inferred in ["continuous", "numeric"] and d_type in ["int", "float"]:
-            numeric_stats = get_numeric_stats(series)
-            column_profile.update(numeric_stats)
+# Longest example / frequency label kept when a profile is embedded in a prompt
+_PROMPT_VALUE_CHARS = 100
+# Columns at least this unique (percent) get no frequency table in prompts
+_PROMPT_NEAR_UNIQUE_PERCENTAGE = 95
 
-        profile[column] = column_profile
 
-    return profile
+def compact_profile_for_prompt(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Trim a dataset profile to what question generation needs, for prompts.
+
+    Long text values are truncated, frequency tables of near-unique columns
+    are dropped as they carry no distribution, numeric statistics are rounded
+    and zero infinite-value counters are omitted. The stored profile is
+    untouched.
+    """
+
+    def clip(value: Any) -> Any:
+        if isinstance(value, str) and len(value) > _PROMPT_VALUE_CHARS:
+            return value[:_PROMPT_VALUE_CHARS] + "..."
+        if isinstance(value, float):
+            return round(value, 4)
+        return value
+
+    compact = {}
+    for column, stats in profile.items():
+        stats = dict(stats)
+        top_freqs = stats.get("top_frequencies")
+        near_unique = (
+            stats.get("distinct_values_percentage", 0) >= _PROMPT_NEAR_UNIQUE_PERCENTAGE
+        )
+        if top_freqs and (near_unique or max(top_freqs.values()) <= 1):
+            del stats["top_frequencies"]
+        elif top_freqs:
+            stats["top_frequencies"] = {
+                clip(str(value)): count for value, count in top_freqs.items()
+            }
+        if "examples" in stats:
+            stats["examples"] = [clip(example) for example in stats["examples"]]
+        if not stats.get("infinite_values"):
+            stats.pop("infinite_values", None)
+            stats.pop("infinite_values_percentage", None)
+        compact[column] = {key: clip(value) for key, value in stats.items()}
+    return compact
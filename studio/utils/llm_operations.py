@@ -1,9 +1,61 @@
+import functools
+import hashlib
 import json
+import os
 import re
-from typing import Any, Dict, Union, List
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union, List
 
 from helpers import get_llm
 from langchain_core.messages import HumanMessage, SystemMessage
+from utils.file_operation import load_prompt_template
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib decoder is used without it
+    orjson = None
+
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+_JSON_START_RE = re.compile(r"[\[{]")
+_JSON_DECODER = json.JSONDecoder()
+
+# Caps in-flight LLM requests across every thread pool in the process; size it
+# to the provider's rate limit with LLM_CONCURRENCY
+LLM_SEMAPHORE = threading.BoundedSemaphore(int(os.getenv("LLM_CONCURRENCY", "16")))
+
+# Model for short, low-reasoning prompts (titles). Unset, every call uses the
+# provider's configured model; set LLM_SMALL_MODEL to route them to a cheaper one
+SMALL_LLM_MODEL = os.getenv("LLM_SMALL_MODEL") or None
+
+
+# Responses to deterministic requests are kept on disk for a week, so re-running
+# the pipeline on the same dataset skips the repeated calls. Sampled
+# (temperature > 0) responses are only cached when LLM_RESPONSE_CACHE is set.
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+_LLM_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+class LLMStreamAborted(Exception):
+    """Raised by an on_chunk callback to stop a streamed response early"""
+
+
+def _loads(text: str) -> Any:
+    """json.loads, through orjson when it is installed"""
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+@functools.lru_cache(maxsize=64)
+def _replacement_pattern(keys: Tuple[str, ...]) -> "re.Pattern[str]":
+    """Alternation matching any of the keys, longest first so none shadows another"""
+    return re.compile("|".join(map(re.escape, sorted(keys, key=len, reverse=True))))
+
+
+@functools.lru_cache(maxsize=16)
+def _llm_cached(temperature: float, max_tokens: int, model: Optional[str]) -> Any:
+    """One client per setting, so calls share its HTTP connection pool"""
+    return get_llm(model=model, temperature=temperature, max_tokens=max_tokens)
 
 
 def invoke_llm_with_prompt(
@@ -12,52 +64,186 @@ def invoke_llm_with_prompt(
     replacements: Dict[str, Any],
     temperature: float = 0.3,
     max_tokens: int = 4096,
+    model: Optional[str] = None,
+    json_mode: bool = False,
+    on_chunk: Optional[Callable[[str], None]] = None,
 ) -> str:
-    """Standardized LLM invocation with prompt template replacement."""
-    # Replace template variables in prompt
+    """
+    Standardized LLM invocation with prompt template replacement.
+
+    model selects a different model (Azure deployment) than the configured
+    default, e.g. SMALL_LLM_MODEL for simple prompts. json_mode asks the
+    provider for a bare JSON object (no fences or prose); the prompt must
+    mention JSON and expect an object, since arrays are not allowed.
+
+    With on_chunk the response is streamed and each text chunk is passed to
+    it as it arrives; raising LLMStreamAborted from on_chunk aborts the
+    request, which stops paying for output that is already known to be unusable.
+    """
+    # Replace template variables in prompt, in one pass over the template
     formatted_prompt = prompt_template
-    for key, value in replacements.items():
-        formatted_prompt = formatted_prompt.replace(key, str(value))
+    if replacements:
+        values = {key: str(value) for key, value in replacements.items()}
+        formatted_prompt = _replacement_pattern(tuple(values)).sub(
+            lambda match: values[match.group(0)], prompt_template
+        )
+
+    cache_path = _response_cache_path(
+        system_content, formatted_prompt, temperature, max_tokens, model, json_mode
+    )
+    if cache_path is not None:
+        cached = _read_cached_response(cache_path)
+        if cached is not None:
+            return cached
+
+    llm = _llm_cached(round(temperature, 3), max_tokens, model)
+    if json_mode:
+        llm = llm.bind(response_format={"type": "json_object"})
 
-    llm = get_llm(temperature=temperature, max_tokens=max_tokens)
+    messages = [
+        SystemMessage(content=system_content),
+        HumanMessage(content=formatted_prompt),
+    ]
+    with LLM_SEMAPHORE:
+        if on_chunk is None:
+            response = llm.invoke(messages)
+            content = getattr(response, "content", str(response))
+        else:
+            parts = []
+            for chunk in llm.stream(messages):
+                text = getattr(chunk, "content", str(chunk))
+                parts.append(text)
+                on_chunk(text)
+            content = "".join(parts)
 
-    response = llm.invoke(
+    if cache_path is not None:
+        _write_cached_response(cache_path, content)
+    return content
+
+
+def _response_cache_path(
+    system_content: str,
+    formatted_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    model: Optional[str],
+    json_mode: bool,
+) -> Optional[str]:
+    """Cache file for a request, or None when its response should not be reused"""
+    if temperature > 0 and not os.getenv("LLM_RESPONSE_CACHE"):
+        return None
+    key = json.dumps(
         [
-            SystemMessage(content=system_content),
-            HumanMessage(content=formatted_prompt),
-        ]
+            os.getenv("LLM_PROVIDER", "openai"),
+            os.getenv("OPENAI_MODEL", ""),
+            os.getenv("AZURE_OPENAI_DEPLOYMENT", ""),
+            model,
+            json_mode,
+            temperature,
+            max_tokens,
+            system_content,
+            formatted_prompt,
+        ],
+        ensure_ascii=False,
     )
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(LLM_CACHE_DIR, f"{digest}.json")
 
-    return getattr(response, "content", str(response))
+
+def _read_cached_response(cache_path: str) -> Optional[str]:
+    """Return a cached response that has not expired yet"""
+    try:
+        if time.time() - os.path.getmtime(cache_path) > _LLM_CACHE_TTL:
+            return None
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)["content"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cached_response(cache_path: str, content: str) -> None:
+    """Store a response; a failed write only costs a future cache miss"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"content": content}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
 
 
 def extract_json_from_response(
     response_content: str,
 ) -> Union[Dict[str, Any], List[Any]]:
     """Extract and parse JSON from LLM response with error handling."""
-    try:
-        # Try to find JSON in markdown code blocks first
-        json_match = re.search(r"```json\s*(.*?)\s*```", response_content, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(1))
-
-        # Try to find JSON array boundaries first
-        json_match = re.search(r"\[.*\]", response_content, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-
-        # Try to find JSON object boundaries
-        json_match = re.search(r"\{.*\}", response_content, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-
-        # If no JSON found, return error structure
-        return {
-            "error": "Could not parse JSON response",
-            "raw_response": response_content,
-        }
-    except json.JSONDecodeError as e:
-        return {
-            "error": f"JSON parsing failed: {e}",
-            "raw_response": response_content,
-        }
+    # JSON-mode and well-behaved responses are bare JSON; parse them directly
+    stripped = response_content.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return _loads(stripped)
+        except json.JSONDecodeError:
+            pass  # trailing prose or several values; fall back to the scan below
+
+    # Try to find JSON in markdown code blocks first
+    fence_match = _JSON_FENCE_RE.search(response_content)
+    if fence_match:
+        try:
+            return _loads(fence_match.group(1))
+        except json.JSONDecodeError as e:
+            return {
+                "error": f"JSON parsing failed: {e}",
+                "raw_response": response_content,
+            }
+
+    # Otherwise return the first array/object embedded in the prose that
+    # decodes; a bracket that does not start valid JSON ("[analysis]") is
+    # skipped and the scan resumes just past it
+    error = "Could not parse JSON response"
+    start = _JSON_START_RE.search(response_content)
+    while start:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(response_content, start.start())
+        except json.JSONDecodeError as e:
+            error = f"JSON parsing failed: {e}"
+            start = _JSON_START_RE.search(response_content, start.start() + 1)
+        else:
+            return value
+
+    # If no JSON found, return error structure
+    return {
+        "error": error,
+        "raw_response": response_content,
+    }
+
+
+def extract_json_with_repair(
+    response_content: str, max_tokens: int = 2048
+) -> Union[Dict[str, Any], List[Any]]:
+    """
+    extract_json_from_response, with one repair attempt when parsing fails.
+
+    Rather than re-running the original request, the malformed text is sent
+    to the small model at temperature 0 to be fixed, which is far cheaper.
+    If the repaired text still does not parse, the original error is returned.
+    """
+    parsed = extract_json_from_response(response_content)
+    if not (isinstance(parsed, dict) and "raw_response" in parsed):
+        return parsed
+
+    print(f"JSON parse failed, attempting repair: {parsed['error']}")
+    repaired = extract_json_from_response(
+        invoke_llm_with_prompt(
+            load_prompt_template("sys_prompts", "repair_json.md"),
+            load_prompt_template("user_prompts", "repair_json.md"),
+            {"raw_response": response_content},
+            temperature=0,
+            max_tokens=max_tokens,
+            model=SMALL_LLM_MODEL,
+        )
+    )
+    if isinstance(repaired, dict) and "raw_response" in repaired:
+        print("JSON repair failed")
+        return parsed
+    return repaired